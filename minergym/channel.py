@@ -1,4 +1,4 @@
-import queue
+import threading
 from typing import Generic, TypeVar
 
 T = TypeVar("T")
@@ -12,32 +12,48 @@ class Channel(Generic[T]):
     rendezvous point: a chan.put() must return only if a chan.get() has been
     executed on the other thread.
 
+    Each channel has a single sender and a single receiver, so a value slot
+    guarded by one condition variable is enough. This avoids allocating a fresh
+    queue for every message, which matters since we exchange several messages
+    per timestep.
+
     """
 
-    _q: queue.Queue[queue.Queue[T]]
-    _closed: bool
+    _value: T
+    _full: bool
+    _cond: threading.Condition
+    closed: bool
 
     def __init__(self):
-        self.q = queue.Queue()
+        self._full = False
+        self._cond = threading.Condition(threading.Lock())
         self.closed = False
 
     def put(self, v: T) -> None:
         assert not self.closed
 
-        wait_q = self.q.get()
-        wait_q.put(v)
+        with self._cond:
+            self._value = v
+            self._full = True
+            self._cond.notify()
+            while self._full:
+                self._cond.wait()
 
     def get(self) -> T:
         assert not self.closed
-        wait_q: queue.Queue[T] = queue.Queue()
-        self.q.put(wait_q)
 
-        return wait_q.get()
+        with self._cond:
+            while not self._full:
+                self._cond.wait()
+            v = self._value
+            self._full = False
+            self._cond.notify()
+            return v
 
     def close(self) -> None:
-        """Close the channel. In python 3.13, we will be able to call
-        .shutdown() on a queue, which will remove the possible race condition
-        that happens when .close() is run at the same time as .put() or .get().
+        """Close the channel. Nothing wakes up a thread already blocked in
+        .put() or .get(), so there is a possible race condition when .close()
+        is run at the same time as one of them.
         """
 
         assert not self.closed
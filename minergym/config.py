@@ -14,7 +14,7 @@ This module collects functions useful to creates those 4-tuples.
 """
 
 from minergym.ontology import Ontology
-import rdflib
+from rdflib.term import Node
 from typing import Any
 import minergym.simulation as simulation
 
@@ -37,12 +37,16 @@ def auto_add_temperature(
     ont: Ontology, obs_template: dict[str, Any]
 ) -> None:
     """Add a "ZONE AIR TEMPERATURE" for each zone in the graph."""
+    _add_temperature(ont.zones(), obs_template)
+
+
+def _add_temperature(zones: list[Node], obs_template: dict[str, Any]) -> None:
     temps = {}
     temps["environment"] = simulation.VariableHole(
         "SITE OUTDOOR AIR DRYBULB TEMPERATURE",
         "ENVIRONMENT",
     )
-    for node in ont.zones():
+    for node in zones:
         z = node.toPython()
         temps[z] = simulation.VariableHole("ZONE AIR TEMPERATURE", z)
         obs_template["temperature"] = temps
@@ -51,6 +55,10 @@ def auto_add_temperature(
 def auto_add_setpoint_variables(
     ont: Ontology, obs_template: dict[str, Any]
 ) -> None:
+    _add_setpoint_variables(ont.zones(), obs_template)
+
+
+def _add_setpoint_variables(zones: list[Node], obs_template: dict[str, Any]) -> None:
     setpoints: Any = {}
     obs_template["setpoints"] = setpoints
 
@@ -60,7 +68,7 @@ def auto_add_setpoint_variables(
     cooling: Any = {}
     setpoints["cooling"] = cooling
 
-    for node in ont.zones():
+    for node in zones:
         z = node.toPython()
         heating[z] = simulation.VariableHole(
             "Zone Thermostat Heating Setpoint Temperature", z
@@ -73,11 +81,15 @@ def auto_add_setpoint_variables(
 def auto_add_comfort(
     ont: Ontology, obs_template: dict[str, Any]
 ) -> None:
+    _add_comfort(ont.zones(), obs_template)
+
+
+def _add_comfort(zones: list[Node], obs_template: dict[str, Any]) -> None:
     if "comfort" not in obs_template:
         obs_template["comfort"] = {}
 
     comfort = obs_template["comfort"]
-    for node in ont.zones():
+    for node in zones:
         z = node.toPython()
         comfort[z + "_comfort"] = simulation.VariableHole(
             "Zone Thermal Comfort Pierce Model Thermal Sensation Index", z
@@ -90,6 +102,10 @@ def auto_add_comfort(
 def auto_add_energy(
     ont: Ontology, obs_template: dict[str, Any]
 ) -> None:
+    _add_energy(ont.zones(), obs_template)
+
+
+def _add_energy(zones: list[Node], obs_template: dict[str, Any]) -> None:
     if "reward" not in obs_template:
         obs_template["energy"] = {}
 
@@ -97,7 +113,7 @@ def auto_add_energy(
 
     r["whole_building"] = simulation.MeterHole("Electricity:HVAC")
 
-    for node in ont.zones():
+    for node in zones:
         z = node.toPython()
         r[z + "_cooling"] = simulation.VariableHole(
             "Zone Air System Sensible Cooling Energy", z
@@ -107,6 +123,19 @@ def auto_add_energy(
         )
 
 
+def auto_add_zones(
+    ont: Ontology, obs_template: dict[str, Any]
+) -> None:
+    """Add the temperature, setpoint, comfort and energy variables of every zone
+    in the graph. This is the same as calling the four `auto_add_*` functions,
+    but the zones are only looked up once."""
+    zones = ont.zones()
+    _add_temperature(zones, obs_template)
+    _add_setpoint_variables(zones, obs_template)
+    _add_comfort(zones, obs_template)
+    _add_energy(zones, obs_template)
+
+
 def auto_add_time(
     ont: Ontology, obs_template: dict[str, Any]
 ) -> None:
@@ -6,7 +6,6 @@ trouble to any gymnasium consumer.
 """
 
 import typing
-from dataclasses import dataclass
 
 import gymnasium
 
@@ -111,4 +110,8 @@ class EnergyPlusEnvironment(gymnasium.Env, typing.Generic[ObsType, ActType]):
                 {"raw_observation": obs},
             )
         else:
-            return (self.last_obs, 0.0, True, False, {})
+            # Stopping at max_steps is a time limit, not the end of the run
+            # period, which gymnasium reports as a truncation.
+            state = self.ep.state
+            truncated = isinstance(state, simulation.StateDone) and state.truncated
+            return (self.last_obs, 0.0, not truncated, truncated, {})
@@ -7,16 +7,12 @@ This module only cares about control.
 
 """
 
-import collections
-import pathlib
-import queue
 import threading
-import traceback
 import weakref
 from ctypes import c_void_p
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Callable, Generic, TypeVar, Union
+from typing import Any, Callable, Union
 
 import optree
 import optree.typing
@@ -26,6 +22,15 @@ from .channel import Channel
 
 api = pyenergyplus.api.EnergyPlusAPI()
 
+# These are called for every handle at every timestep. Binding them once saves
+# two attribute lookups per call.
+_get_variable_value = api.exchange.get_variable_value
+_get_meter_value = api.exchange.get_meter_value
+_get_actuator_value = api.exchange.get_actuator_value
+_set_actuator_value = api.exchange.set_actuator_value
+_api_data_fully_ready = api.exchange.api_data_fully_ready
+_warmup_flag = api.exchange.warmup_flag
+
 
 @dataclass
 class ManagedState:
@@ -99,6 +104,63 @@ class FunctionHole:
 _AnyHandle = VariableHandle | MeterHandle | ActuatorHandle | FunctionHole
 AnyHole = VariableHole | MeterHole | ActuatorHole | FunctionHole
 
+# How to read the value behind each kind of handle. The handle classes are
+# never subclassed, so dispatching on the exact type is a single dict lookup
+# instead of a chain of isinstance checks.
+_HANDLE_READERS: dict[type, Callable[[c_void_p, Any], Any]] = {
+    VariableHandle: lambda ep_state, han: _get_variable_value(ep_state, han.handle),
+    MeterHandle: lambda ep_state, han: _get_meter_value(ep_state, han.handle),
+    ActuatorHandle: lambda ep_state, han: _get_actuator_value(ep_state, han.handle),
+    FunctionHole: lambda ep_state, han: han.function(ep_state),
+}
+
+
+def _resolve_variable(state: c_void_p, var: VariableHole) -> VariableHandle:
+    han = api.exchange.get_variable_handle(
+        state,
+        var.variable_name,
+        var.variable_key,
+    )
+    if han < 0:
+        raise InvalidVariable(var)
+    return VariableHandle(han)
+
+
+def _resolve_meter(state: c_void_p, met: MeterHole) -> MeterHandle:
+    han = api.exchange.get_meter_handle(state, met.meter_name)
+    if han < 0:
+        raise InvalidMeter(met)
+    return MeterHandle(han)
+
+
+def _resolve_actuator(state: c_void_p, act: ActuatorHole) -> ActuatorHandle:
+    han = api.exchange.get_actuator_handle(
+        state,
+        act.component_type,
+        act.control_type,
+        act.actuator_key,
+    )
+    if han < 0:
+        raise InvalidActuator(act)
+    return ActuatorHandle(han)
+
+
+# How to turn each kind of hole into a handle, once the simulation is running.
+_HOLE_RESOLVERS: dict[type, Callable[[c_void_p, Any], _AnyHandle]] = {
+    VariableHole: _resolve_variable,
+    MeterHole: _resolve_meter,
+    ActuatorHole: _resolve_actuator,
+    # We don't need to turn it into anything else.
+    FunctionHole: lambda state, fun: fun,
+}
+
+
+def _get_handle_value(ep_state: c_void_p, han: _AnyHandle) -> Any:
+    reader = _HANDLE_READERS.get(type(han))
+    if reader is None:
+        raise Exception(f"got a weird thing: {han}")
+    return reader(ep_state, han)
+
 
 # communication choregraphy
 
@@ -155,6 +217,16 @@ class StateStarting:
 
     number_of_warmup_phases_completed: int = 0
 
+    """The output of `construct_handles`, once it has been run."""
+    handles: (
+        tuple[
+            list[_AnyHandle],
+            optree.PyTreeSpec,
+            dict[tuple[Any, ...], ActuatorHandle],
+        ]
+        | None
+    ) = None
+
 
 @dataclass(slots=True)
 class StateStarted:
@@ -163,16 +235,34 @@ class StateStarted:
 
     channel: Channel[E2PMessage]
 
-    observation_handles: Any
-    actuator_handles: Any
+    """The leaves of the observation template, resolved to handles. Reading
+    them into a flat list and unflattening it with `observation_treespec` is
+    cheaper than mapping over the whole tree at every timestep."""
+    observation_handles: list[_AnyHandle]
+    observation_treespec: optree.PyTreeSpec
+
+    """Maps the path of each actuator in the actuator tree to its handle, so
+    that an action can be applied without walking the actuator tree."""
+    actuator_handles: dict[tuple[Any, ...], ActuatorHandle]
 
     last_observation: Any
 
+    """Whether the simulation was stopped because it reached `max_steps`."""
+    truncated: bool = False
+
+    """Whether we asked energyplus to stop. It can still run a few timesteps
+    before it actually does, and those must not exchange any message."""
+    stopping: bool = False
+
 
 @dataclass(slots=True, frozen=True)
 class StateDone:
     last_observation: Any
 
+    """Whether the simulation was stopped because it reached `max_steps`,
+    rather than at the end of its run period."""
+    truncated: bool = False
+
 
 @dataclass(slots=True, frozen=True)
 class StateCrashed:
@@ -201,8 +291,9 @@ class EnergyPlusSimulation:
 
     n_steps: int = field(default=0, init=False)
 
-    """The amount of steps before the simulation exits."""
-    max_steps: int = 10_000
+    """The amount of steps before the simulation exits. If None, the simulation
+    runs until the end of its run period."""
+    max_steps: int | None = None
 
     """The directory in which energyplus will write its log files."""
     log_dir: Path = Path("eplus_output")
@@ -215,24 +306,14 @@ class EnergyPlusSimulation:
     def _reverse_step(self):
         """Send the current observation, then receive an action and run it."""
 
-        def get_handle_value(ep_state: c_void_p, han: _AnyHandle) -> float:
-            if isinstance(han, VariableHandle):
-                return api.exchange.get_variable_value(ep_state, han.handle)
-            elif isinstance(han, MeterHandle):
-                return api.exchange.get_meter_value(ep_state, han.handle)
-            elif isinstance(han, ActuatorHandle):
-                return api.exchange.get_actuator_value(ep_state, han.handle)
-            elif isinstance(han, FunctionHole):
-                result = han.function(ep_state)
-                return result
-            else:
-                raise Exception(f"got a weird thing: {han}")
-
         if isinstance(self.state, StateStarted):
-            state = self.state
-            obs = optree.tree_map(
-                lambda han: get_handle_value(state.ep_state.inner, han),
-                self.state.observation_handles,
+            ep_state = self.state.ep_state.inner
+            obs = optree.tree_unflatten(
+                self.state.observation_treespec,
+                [
+                    _get_handle_value(ep_state, han)
+                    for han in self.state.observation_handles
+                ],
             )
 
             self.state.last_observation = obs
@@ -244,50 +325,64 @@ class EnergyPlusSimulation:
             response = response_chan.get()
             if isinstance(response, RunAction):
                 act = response.act
+                # For each value in the action, find the actuator handle at the
                 # same path and set its value.
-                for accessor in optree.tree_accessors(act):
-                    h: ActuatorHandle = accessor(self.state.actuator_handles)
-                    the_value = accessor(act)
-                    api.exchange.set_actuator_value(
-                        self.state.ep_state.inner, h.handle, the_value
-                    )
+                actuator_handles = self.state.actuator_handles
+                paths, values, _ = optree.tree_flatten_with_path(act)
+                for path, the_value in zip(paths, values):
+                    h = actuator_handles[path]
+                    _set_actuator_value(ep_state, h.handle, the_value)
             elif isinstance(response, ShutDown):
+                self.state.stopping = True
                 api.runtime.stop_simulation(self.state.ep_state.inner)
                 return
 
     def callback_timestep(self, _) -> None:
         if isinstance(self.state, StateStarting):
-            if not api.exchange.api_data_fully_ready(self.state.ep_state.inner):
-                return
-
-            if api.exchange.warmup_flag(self.state.ep_state.inner):
-                return
+            starting = self.state
+
+            # Handles can be resolved as soon as the api data is ready, which
+            # happens during the first warmup phase. Doing it then rather than
+            # after all the warmup phases means that an invalid variable, meter
+            # or actuator makes .start() fail right away.
+            if starting.handles is None:
+                if not _api_data_fully_ready(starting.ep_state.inner):
+                    return
+
+                try:
+                    starting.handles = self.construct_handles(
+                        starting.ep_state.inner
+                    )
+                except Exception as e:
+                    api.runtime.stop_simulation(starting.ep_state.inner)
+                    self.state = StateCrashed()
+                    starting.channel.put(ICrashed(e))
+                    return
 
             # The energyplus simulator has 5 warmup phases. If we start
             # evaluating setpoints and sending observations before all the
             # warmup phases are all done, the policy will see the date jump
             # around, which is bad.
-            if self.state.number_of_warmup_phases_completed < self.warmup_phases:
+            #
+            # This is checked before the warmup flag since it is the condition
+            # that holds for most of the warmup timesteps and it doesn't need
+            # to call into energyplus.
+            if starting.number_of_warmup_phases_completed < self.warmup_phases:
                 return
 
-            try:
-                obs, act = self.construct_handles(self.state.ep_state.inner)
-                new_state = StateStarted(
-                    self.state.ep_state,
-                    self.state.ep_thread,
-                    self.state.channel,
-                    obs,
-                    act,
-                    None,
-                )
-            except Exception as e:
-                api.runtime.stop_simulation(self.state.ep_state.inner)
-                old_state = self.state
-                self.state = StateCrashed()
-                old_state.channel.put(ICrashed(e))
+            if _warmup_flag(starting.ep_state.inner):
                 return
 
-            self.state = new_state  # type: ignore
+            obs, obs_treespec, act = starting.handles
+            self.state = StateStarted(
+                starting.ep_state,
+                starting.ep_thread,
+                starting.channel,
+                obs,
+                obs_treespec,
+                act,
+                None,
+            )
 
             try:
                 self._reverse_step()
@@ -299,13 +394,32 @@ class EnergyPlusSimulation:
                 return
 
         elif isinstance(self.state, StateStarted):
+            if self.state.stopping:
+                return
+            if self.max_steps is not None and self.n_steps >= self.max_steps:
+                # Once energyplus returns, the simulation thread reports the
+                # shutdown to whoever is waiting on the last .step().
+                self.state.truncated = True
+                self.state.stopping = True
+                api.runtime.stop_simulation(self.state.ep_state.inner)
+                return
             self._reverse_step()
+        elif isinstance(self.state, StateCrashed):
+            # We asked energyplus to stop, but it can still run a few timesteps
+            # before it actually does.
+            return
         else:
             raise Exception("TODO")
 
         self.n_steps += 1
 
-    def construct_handles(self, state: c_void_p) -> tuple[Any, Any]:
+    def construct_handles(
+        self, state: c_void_p
+    ) -> tuple[
+        list[_AnyHandle],
+        optree.PyTreeSpec,
+        dict[tuple[Any, ...], ActuatorHandle],
+    ]:
         if self.verbose:
             print("constructing handles")
 
@@ -314,59 +428,33 @@ class EnergyPlusSimulation:
         # This is what we do here.
 
         def get_hole_handle(o: AnyHole) -> _AnyHandle:
-            if isinstance(o, VariableHole):
-                var = o
-                han = api.exchange.get_variable_handle(
-                    state,
-                    var.variable_name,
-                    var.variable_key,
-                )
-                if han < 0:
-                    raise InvalidVariable(var)
-                return VariableHandle(han)
-            elif isinstance(o, MeterHole):
-                met = o
-                han = api.exchange.get_meter_handle(state, met.meter_name)
-                if han < 0:
-                    raise InvalidMeter(met)
-                return MeterHandle(han)
-            elif isinstance(o, ActuatorHole):
-                act = o
-                han = api.exchange.get_actuator_handle(
-                    state,
-                    act.component_type,
-                    act.control_type,
-                    act.actuator_key,
-                )
-                if han < 0:
-                    raise InvalidActuator(act)
-                return ActuatorHandle(han)
-            elif isinstance(o, FunctionHole):
-                # We don't need to turn it into anything else.
-                return o
-            else:
+            resolver = _HOLE_RESOLVERS.get(type(o))
+            if resolver is None:
                 raise Exception(f"got a weird thing: {o}")
+            return resolver(state, o)
 
-        observation_handles = optree.tree_map(
-            get_hole_handle,
-            self.observation_template,
+        observation_holes, observation_treespec = optree.tree_flatten(
+            self.observation_template
         )
+        observation_handles = [get_hole_handle(o) for o in observation_holes]
 
-        def get_actuator_handle(act: ActuatorHole) -> ActuatorHandle:
-            return ActuatorHandle(
-                api.exchange.get_actuator_handle(
-                    state, act.component_type, act.control_type, act.actuator_key
-                )
-            )
-
-        actuator_handles = optree.tree_map(
-            get_actuator_handle,
-            self.actuators,
+        actuator_paths, actuator_holes, _ = optree.tree_flatten_with_path(
+            self.actuators
         )
+        actuator_handles = {
+            path: _resolve_actuator(state, hole)
+            for path, hole in zip(actuator_paths, actuator_holes)
+        }
 
-        return observation_handles, actuator_handles
+        return observation_handles, observation_treespec, actuator_handles
 
     def start(self) -> tuple[Any, bool]:
+        # Energyplus would also notice, but only after we have paid for a new
+        # state and a thread.
+        for path in (self.building_path, self.weather_path):
+            if not Path(path).exists():
+                raise FileNotFoundError(f"No such file: {path}")
+
         managed_ep_state: ManagedState = ManagedState()
 
         def eplus_thread():
@@ -390,7 +478,9 @@ class EnergyPlusSimulation:
 
             if exit_code == 0:
                 if isinstance(self.state, StateStarted):
-                    self.state = StateDone(self.state.last_observation)
+                    self.state = StateDone(
+                        self.state.last_observation, self.state.truncated
+                    )
                     old_state.channel.put(IShutDown())
                 elif isinstance(self.state, StateCrashed):
                     # If the simulation exited abnormally, we don't need to change
@@ -463,7 +553,9 @@ class EnergyPlusSimulation:
         self.state = new_state
         thread.start()
 
-        msg = self.state.channel.get()
+        # If the simulation crashes, the simulation thread replaces self.state
+        # before sending us the error.
+        msg = new_state.channel.get()
         if isinstance(msg, IGotObservation):
             return msg.observation, False
         elif isinstance(msg, ICrashed):
@@ -475,15 +567,18 @@ class EnergyPlusSimulation:
         if not isinstance(self.state, StateStarted):
             raise InvalidStateException(StateStarted, self.state)
 
-        msg1 = self.state.channel.get()
+        # The simulation thread replaces self.state when the simulation ends,
+        # possibly before we get to read its last message.
+        state = self.state
+        msg1 = state.channel.get()
         if isinstance(msg1, IWantAction):
             msg1.response.put(RunAction(action))
-            msg2 = self.state.channel.get()
+            msg2 = state.channel.get()
             if isinstance(msg2, IGotObservation):
                 obs = msg2.observation
                 return obs, False
             elif isinstance(msg2, IShutDown):
-                return self.state.last_observation, True
+                return state.last_observation, True
             elif isinstance(msg2, ICrashed):
                 raise msg2.exception
             else:
@@ -492,7 +587,8 @@ class EnergyPlusSimulation:
             raise Exception("TODO")
 
     def stop(self):
-        """When in a started state, stop the simulation."""
+        """When in a started state, stop the simulation and wait for the
+        energyplus thread to exit."""
         if not isinstance(self.state, StateStarted):
             raise InvalidStateException(StateStarted, self.state)
 
@@ -503,6 +599,9 @@ class EnergyPlusSimulation:
 
             msg2 = state.channel.get()
             if isinstance(msg2, IShutDown):
+                # The thread has nothing left to do but return. Wait for it, so
+                # that the energyplus run is really over when we return.
+                state.ep_thread.join()
                 return  # All is good
             else:
                 assert False, "Should be unreachable."
@@ -0,0 +1,59 @@
+import pytest
+
+import minergym.data.building as building
+from minergym.ontology import Ontology
+
+
+@pytest.fixture(scope="session")
+def crawlspace_ontology() -> Ontology:
+    """The ontology of the crawlspace building, shared by every test. Don't
+    modify it.
+
+    This deliberately doesn't use the on-disk cache of `Ontology.from_json`:
+    the tests must run against the graph the current code builds. Being
+    session-scoped, the fixture already parses the file only once per
+    worker."""
+    return Ontology.from_json(building.crawlspace)
+
+
+@pytest.fixture
+def make_simulation(tmp_path):
+    """Return a function building `EnergyPlusSimulation`s, by default on the
+    crawlspace building and the honolulu weather file. Every simulation built
+    this way is stopped at the end of the test.
+
+    Simulations can't be restarted, so they can't be shared between tests.
+    However, a started simulation keeps its energyplus thread (and state)
+    alive until it is stopped, so a test that doesn't run it to completion
+    would otherwise leave it hanging for the rest of the session.
+
+    Unless told otherwise, energyplus writes its output to the test's
+    temporary directory, so that tests running in parallel (with
+    pytest-xdist) don't write to the same files.
+
+    Tests using it are skipped when pyenergyplus isn't installed."""
+    pytest.importorskip("pyenergyplus", reason="EnergyPlus unavailable")
+    import minergym.simulation as simulation
+    from minergym.data.building import crawlspace
+    from minergym.data.weather import honolulu
+
+    sims: list[simulation.EnergyPlusSimulation] = []
+
+    def make(
+        observation_template,
+        actuators,
+        building=crawlspace,
+        weather=honolulu,
+        **kwargs,
+    ) -> simulation.EnergyPlusSimulation:
+        kwargs.setdefault("log_dir", tmp_path / f"eplus_output_{len(sims)}")
+        sim = simulation.EnergyPlusSimulation(
+            building, weather, observation_template, actuators, **kwargs
+        )
+        sims.append(sim)
+        return sim
+
+    yield make
+
+    for sim in sims:
+        sim.try_stop()
@@ -0,0 +1,35 @@
+import threading
+
+from minergym.channel import Channel
+
+
+def test_channel_passes_values_in_order() -> None:
+    chan: Channel[int] = Channel()
+
+    def sender():
+        for i in range(100):
+            chan.put(i)
+
+    thread = threading.Thread(target=sender, daemon=True)
+    thread.start()
+
+    assert [chan.get() for _ in range(100)] == list(range(100))
+    thread.join(timeout=1.0)
+    assert not thread.is_alive()
+
+
+def test_channel_put_waits_for_get() -> None:
+    chan: Channel[str] = Channel()
+    done = threading.Event()
+
+    def sender():
+        chan.put("hello")
+        done.set()
+
+    thread = threading.Thread(target=sender, daemon=True)
+    thread.start()
+
+    # Nobody has received the value yet, so .put() must not have returned.
+    assert not done.wait(timeout=0.1)
+    assert chan.get() == "hello"
+    assert done.wait(timeout=1.0)
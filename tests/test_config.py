@@ -1,23 +1,31 @@
+import pytest
+
+pytest.importorskip("pyenergyplus", reason="EnergyPlus unavailable")
+
 import minergym.config as config
-from minergym.ontology import Ontology
-import tests.test_data as test_data
-import minergym.simulation as simulation
-import minergym.data.building as building
-import minergym.data.weather as weather
 
 
-def test_full_config() -> None:
+def test_full_config(crawlspace_ontology, make_simulation) -> None:
 
     obs_template = {}
-    ont = Ontology.from_json(building.crawlspace)
 
-    config.auto_add_temperature(ont, obs_template)
-    config.auto_add_energy(ont, obs_template)
+    config.auto_add_temperature(crawlspace_ontology, obs_template)
+    config.auto_add_energy(crawlspace_ontology, obs_template)
 
-    sim = simulation.EnergyPlusSimulation(
-        building.crawlspace,
-        weather.honolulu,
-        obs_template,
-        {},
-    )
+    sim = make_simulation(obs_template, {})
     sim.start()
+
+
+def test_auto_add_zones(crawlspace_ontology) -> None:
+    ont = crawlspace_ontology
+
+    expected = {}
+    config.auto_add_temperature(ont, expected)
+    config.auto_add_setpoint_variables(ont, expected)
+    config.auto_add_comfort(ont, expected)
+    config.auto_add_energy(ont, expected)
+
+    obs_template = {}
+    config.auto_add_zones(ont, obs_template)
+
+    assert obs_template == expected
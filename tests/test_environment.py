@@ -1,4 +1,8 @@
 import gymnasium
+import pytest
+
+pytest.importorskip("pyenergyplus", reason="EnergyPlus unavailable")
+
 import minergym.environment as environment
 import minergym.simulation as simulation
 import numpy as np
@@ -6,13 +10,14 @@ from minergym.data.building import crawlspace
 from minergym.data.weather import honolulu
 
 
-def make_energyplus():
+def make_energyplus(log_dir):
     return simulation.EnergyPlusSimulation(
         crawlspace,
         honolulu,
         None,
         {},
         max_steps=100,
+        log_dir=log_dir,
     )
 
 
@@ -21,9 +26,9 @@ empty_space = gymnasium.spaces.Box(
 )
 
 
-def test_environment() -> None:
+def test_environment(tmp_path) -> None:
     env = environment.EnergyPlusEnvironment(
-        make_energyplus,
+        lambda: make_energyplus(tmp_path),
         lambda _: 0.0,
         empty_space,
         lambda _: np.array([]),
@@ -32,9 +37,12 @@ def test_environment() -> None:
     )
 
     obs, _ = env.reset()
-    done = False
-    while not done:
-        obs, reward, done, _, _ = env.step(np.array([]))
+    terminated = truncated = False
+    while not (terminated or truncated):
+        obs, reward, terminated, truncated, _ = env.step(np.array([]))
+
+    # The simulation was cut short by max_steps.
+    assert truncated and not terminated
 
 
 # def test_reset() -> None:
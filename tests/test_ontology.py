@@ -1,11 +1,13 @@
+import json
+import os
 import rdflib
+import minergym.ontology as ontology
 from minergym.ontology import Ontology
 import minergym.data.building as building
 
 
-def test_zones():
-
-    zones_expected = [
+CRAWLSPACE_ZONES = frozenset(
+    [
         "Breezeway",
         "attic",
         "crawlspace",
@@ -28,14 +30,124 @@ def test_zones():
         "living_unit3_FrontRow_MiddleFloor",
         "living_unit3_FrontRow_TopFloor",
     ]
+)
+
+
+def test_zones(crawlspace_ontology):
+    zones_real = frozenset(node.toPython() for node in crawlspace_ontology.zones())
 
-    ont = Ontology.from_json(building.crawlspace)
+    assert zones_real == CRAWLSPACE_ZONES
 
-    zones_real = [node.toPython() for node in ont.zones()]
 
-    assert set(zones_expected) == set(zones_real)
+def test_from_object() -> None:
+    # Bypass every cache, so that regressions in the parser itself show up.
+    with open(building.crawlspace) as f:
+        ont = Ontology.from_object(json.load(f))
 
+    zones_real = frozenset(node.toPython() for node in ont.zones())
 
-def test_minimum_number_of_days() -> None:
-    ont = Ontology.from_json(building.crawlspace)
+    assert zones_real == CRAWLSPACE_ZONES
     assert ont.minimum_number_of_warmup_days() == 6
+
+
+def test_minimum_number_of_days(crawlspace_ontology) -> None:
+    assert crawlspace_ontology.minimum_number_of_warmup_days() == 6
+
+
+def test_from_json_is_cached(tmp_path) -> None:
+    ont = Ontology.from_json(building.crawlspace, cached=True)
+    assert Ontology.from_json(building.crawlspace, cached=True) is ont
+
+    path = tmp_path / "building.epJSON"
+    path.write_text('{"Zone": {"a": {}}}')
+    zones = Ontology.from_json(path, cached=True).zones()
+    assert [z.toPython() for z in zones] == ["a"]
+
+    # Rewriting the file must invalidate the cached ontology.
+    path.write_text('{"Zone": {"b": {}}}')
+    os.utime(path, ns=(0, 0))
+    zones = Ontology.from_json(path, cached=True).zones()
+    assert [z.toPython() for z in zones] == ["b"]
+
+
+def test_from_json_is_not_shared(tmp_path) -> None:
+    path = tmp_path / "building.epJSON"
+    path.write_text('{"Zone": {"a": {}}}')
+
+    ont = Ontology.from_json(path)
+    ont.rdf.add((rdflib.Literal("ghost"), rdflib.RDF.type, ontology.ZONE))
+
+    # Without cached=True, changing one ontology doesn't affect later loads.
+    assert [z.toPython() for z in Ontology.from_json(path).zones()] == ["a"]
+
+
+def test_from_json_disk_cache(tmp_path) -> None:
+    path = tmp_path / "building.epJSON"
+    path.write_text('{"Zone": {"a": {}}}')
+    cache_dir = tmp_path / "cache"
+
+    ont = Ontology.from_json(path, cache_dir=cache_dir)
+    assert len(list(cache_dir.iterdir())) == 1
+
+    # Change the file behind the cache's back, keeping its modification time.
+    # The pickled ontology must be the one that gets loaded.
+    mtime_ns = path.stat().st_mtime_ns
+    path.write_text('{"Zone": {"b": {}}}')
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    cached = Ontology.from_json(path, cache_dir=cache_dir)
+    assert cached is not ont
+    assert [z.toPython() for z in cached.zones()] == ["a"]
+
+
+def test_from_json_without_orjson(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(ontology, "orjson", None)
+
+    path = tmp_path / "building.epJSON"
+    path.write_text('{"Zone": {"a": {}}}')
+    assert [z.toPython() for z in Ontology.from_json(path).zones()] == ["a"]
+
+
+def test_from_json_disk_cache_corrupt(tmp_path) -> None:
+    path = tmp_path / "building.epJSON"
+    path.write_text('{"Zone": {"a": {}}}')
+    cache_dir = tmp_path / "cache"
+
+    Ontology.from_json(path, cache_dir=cache_dir)
+    [cache_file] = cache_dir.iterdir()
+    cache_file.write_bytes(b"garbage")
+
+    # The broken entry is ignored, then replaced by a fresh one.
+    ont = Ontology.from_json(path, cache_dir=cache_dir)
+    assert [z.toPython() for z in ont.zones()] == ["a"]
+    assert cache_file.read_bytes() != b"garbage"
+
+
+def test_from_json_disk_cache_source(tmp_path, monkeypatch) -> None:
+    path = tmp_path / "building.epJSON"
+    path.write_text('{"Zone": {"a": {}}}')
+    cache_dir = tmp_path / "cache"
+
+    Ontology.from_json(path, cache_dir=cache_dir)
+    monkeypatch.setattr(ontology, "_SOURCE_DIGEST", "changed")
+    Ontology.from_json(path, cache_dir=cache_dir)
+
+    # Another version of the ontology module doesn't reuse the old entry.
+    assert len(list(cache_dir.iterdir())) == 2
+
+
+def test_from_json_disk_cache_unwritable(tmp_path, monkeypatch) -> None:
+    path = tmp_path / "building.epJSON"
+    path.write_text('{"Zone": {"a": {}}}')
+    cache_dir = tmp_path / "cache"
+
+    def fail(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(ontology.pickle, "dump", fail)
+
+    # Parsing succeeded, so failing to write the cache isn't an error, and no
+    # temporary file is left behind.
+    ont = Ontology.from_json(path, cache_dir=cache_dir)
+    assert [z.toPython() for z in ont.zones()] == ["a"]
+    assert list(cache_dir.iterdir()) == []
@@ -1,14 +1,16 @@
-from importlib import resources
 from pathlib import Path
 
-import minergym.simulation as simulation
 import pytest
+
+pytest.importorskip("pyenergyplus", reason="EnergyPlus unavailable")
+
+import minergym.simulation as simulation
 from minergym.data.building import crawlspace
 from minergym.data.weather import honolulu
 
 
-def test_simulation_runs() -> None:
-    sim = simulation.EnergyPlusSimulation(crawlspace, honolulu, None, {}, max_steps=100)
+def test_simulation_runs(make_simulation) -> None:
+    sim = make_simulation(None, {}, max_steps=10)
 
     obs, done = sim.start()
     while not done:
@@ -16,47 +18,44 @@ def test_simulation_runs() -> None:
         obs, done = sim.step({})
 
 
-def test_simulation_obs() -> None:
+def test_simulation_obs(make_simulation) -> None:
     obs_template = {
         "temp": simulation.VariableHole("ZONE AIR TEMPERATURE", "crawlspace")
     }
 
-    sim = simulation.EnergyPlusSimulation(
-        crawlspace, honolulu, obs_template, {}, max_steps=100
-    )
+    sim = make_simulation(obs_template, {}, max_steps=100)
     obs, done = sim.start()
     assert obs["temp"] != 0.0
 
 
-def test_simulation_invalid_variable() -> None:
-    # an invalid variable
-    obs_template = simulation.VariableHole("", "")
-
-    sim = simulation.EnergyPlusSimulation(
-        crawlspace, honolulu, obs_template, {}, max_steps=100
-    )
-
-    with pytest.raises(simulation.InvalidVariable) as exn_info:
-        obs, done = sim.start()
+@pytest.mark.parametrize(
+    "hole, exception",
+    [
+        (simulation.VariableHole("", ""), simulation.InvalidVariable),
+        (simulation.MeterHole(""), simulation.InvalidMeter),
+        (simulation.ActuatorHole("", "", ""), simulation.InvalidActuator),
+    ],
+)
+def test_simulation_invalid_hole(make_simulation, hole, exception) -> None:
+    sim = make_simulation(hole, {}, max_steps=100)
 
+    with pytest.raises(exception):
+        sim.start()
 
-def test_simulation_invalid_meter() -> None:
-    obs_template = simulation.MeterHole("")
 
-    sim = simulation.EnergyPlusSimulation(
-        crawlspace, honolulu, obs_template, {}, max_steps=100
-    )
+def test_simulation_invalid_actuator(make_simulation) -> None:
+    sim = make_simulation({}, simulation.ActuatorHole("", "", ""), max_steps=100)
 
-    with pytest.raises(simulation.InvalidMeter) as exn_info:
-        obs, done = sim.start()
+    with pytest.raises(simulation.InvalidActuator):
+        sim.start()
 
 
-def test_simulation_time() -> None:
+def test_simulation_time(make_simulation) -> None:
     obs = {}
     obs["current_time"] = simulation.FunctionHole(simulation.api.exchange.current_time)
     obs["day_of_year"] = simulation.FunctionHole(simulation.api.exchange.day_of_year)
 
-    sim = simulation.EnergyPlusSimulation(crawlspace, honolulu, obs, {}, max_steps=1000)
+    sim = make_simulation(obs, {}, max_steps=50)
     obs, done = sim.start()
     while True:
         new_obs, done = sim.step({})
@@ -74,24 +73,28 @@ def test_simulation_time() -> None:
 def test_simulation_missing_file() -> None:
     sim = simulation.EnergyPlusSimulation(Path("does_not_exist"), honolulu, {}, {})
 
-    with pytest.raises(Exception):
+    with pytest.raises(FileNotFoundError):
         sim.start()
 
+    assert isinstance(sim.state, simulation.StateInit)
+
 
 def test_simulation_repr() -> None:
     sim = simulation.EnergyPlusSimulation(crawlspace, honolulu, {}, {})
-    print(sim)
+    assert repr(sim).startswith("EnergyPlusSimulation(")
+    assert repr(crawlspace) in repr(sim)
+    assert isinstance(sim.state, simulation.StateInit)
 
 
-def test_get_api_endpoints() -> None:
-    sim = simulation.EnergyPlusSimulation(crawlspace, honolulu, {}, {})
+def test_get_api_endpoints(make_simulation) -> None:
+    sim = make_simulation({}, {})
     sim.start()
 
     # Will crash is some unknown api object is encountered
     sim.get_api_endpoints()
 
 
-def test_simulation_set_actuator_value() -> None:
+def test_simulation_set_actuator_value(make_simulation) -> None:
     actuators = {
         "heating_sch": simulation.ActuatorHole(
             component_type="Schedule:Compact",
@@ -105,9 +108,7 @@ def test_simulation_set_actuator_value() -> None:
         ),
     }
 
-    sim = simulation.EnergyPlusSimulation(
-        crawlspace, honolulu, actuators, actuators, max_steps=100
-    )
+    sim = make_simulation(actuators, actuators, max_steps=2)
     sim.start()
 
     obs, done = sim.step({"heating_sch": 15})
@@ -115,7 +116,7 @@ def test_simulation_set_actuator_value() -> None:
     assert obs["heating_sch"] == 15
 
 
-def test_simulation_structured_actuators() -> None:
+def test_simulation_structured_actuators(make_simulation) -> None:
     actuators = {
         "zone_1": {
             "heating_sch": simulation.ActuatorHole(
@@ -131,17 +132,15 @@ def test_simulation_structured_actuators() -> None:
         }
     }
 
-    sim = simulation.EnergyPlusSimulation(
-        crawlspace, honolulu, actuators, actuators, max_steps=100
-    )
+    sim = make_simulation(actuators, actuators, max_steps=2)
     sim.start()
 
     obs, done = sim.step({"zone_1": {"heating_sch": 15}})
     assert obs["zone_1"]["heating_sch"] == 15
 
 
-def test_simulation_stop() -> None:
-    sim = simulation.EnergyPlusSimulation(crawlspace, honolulu, None, {}, max_steps=100)
+def test_simulation_stop(make_simulation) -> None:
+    sim = make_simulation(None, {}, max_steps=100)
 
     obs, done = sim.start()
 
@@ -158,3 +157,19 @@ def test_simulation_stop() -> None:
     assert isinstance(sim.state, simulation.StateDone)
 
     assert not thread.is_alive()
+
+
+def test_simulation_max_steps(make_simulation) -> None:
+    sim = make_simulation(None, {}, max_steps=5)
+
+    obs, done = sim.start()
+    n_steps = 0
+    while not done:
+        obs, done = sim.step({})
+        n_steps += 1
+
+    # Five observations: one from .start() and four from .step(), then a last
+    # .step() reports that the simulation is done.
+    assert n_steps == 5
+    assert isinstance(sim.state, simulation.StateDone)
+    assert sim.state.truncated